@@ -31,7 +31,7 @@ def find_version(*file_paths):
 
 # setup main
 # required modules
-install_requires = ["yamc-server>=1.0.2", "dms-collector>=2.0.1", "cx-Oracle==8.3.0"]
+install_requires = ["yamc-server>=1.0.2", "dms-collector>=2.0.1", "oracledb>=1.0.0"]
 
 setup(
     name="yamc-oracle",
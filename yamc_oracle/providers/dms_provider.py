@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 # @author: Tomas Vitvar, https://vitvar.com, tomas@vitvar.com
 
+import re
 import time
+import threading
+import weakref
 
 import dms_collector
 from dms_collector import DmsCollector
@@ -9,20 +12,38 @@ from yamc.providers import PerformanceProvider
 
 from yamc.utils import Map, perf_counter
 
+# collectors shared by providers that are polled from the same thread and connect to the same DMS Spy with the same
+# credentials; a collector is only ever used by the thread it is registered for
+_collectors = weakref.WeakValueDictionary()
+_collectors_lock = threading.Lock()
+
+
+class SharedCollector:
+    """
+    A DmsCollector shared by the providers polled from one thread together with its creation time.
+    """
+
+    def __init__(self, dms):
+        self.dms = dms
+        self.created_time = time.time()
+
 
 class DmsProvider(PerformanceProvider):
     """
     A yamc provider for Oracle FMW DMS Spy application. DMS Spy provides a massive amount of metrics about WebLogic
-    and other software running in WebLogic. The provider is a wrapper around dms-collector.
+    and other software running in WebLogic. The provider is a wrapper around dms-collector. Providers polled from
+    the same thread with the same URL and credentials share one DmsCollector, while providers polled from different
+    threads use their own collectors and run concurrently.
     """
 
     def __init__(self, config, component_id):
         super().__init__(config, component_id)
-        self.connect_time = 0
-        self.dms = None
+        self.local = threading.local()
 
         # configuration
         self.admin_url = self.config.value_str("admin_url", required=True)
+        if not re.match(r"https?://", self.admin_url, re.IGNORECASE):
+            raise Exception("The admin_url %s must be an http or https URL!" % self.admin_url)
         self.username = self.config.value_str("username", required=True)
         self.password = self.config.value_str("password", required=True)
         self.reconnect_after = self.config.value_int("reconnect_after", default=3600)
@@ -34,18 +55,27 @@ class DmsProvider(PerformanceProvider):
         )
 
     def init_dms(self):
-        if self.dms is None or time.time() - self.connect_time > self.reconnect_after:
-            if self.dms is not None:
-                self.log.info("Reconnecting to DMS Spy after %d seconds." % self.reconnect_after)
-            self.dms = DmsCollector(self.admin_url, username=self.username, password=self.password)
-            self.log.info(
-                "DMS provider initialized: url=%s, username=%s, password=(secret)" % (self.admin_url, self.username)
-            )
-            self.connect_time = time.time()
+        shared = getattr(self.local, "shared", None)
+        if shared is None or time.time() - shared.created_time > self.reconnect_after:
+            key = (threading.get_ident(), self.admin_url, self.username, self.password)
+            with _collectors_lock:
+                registered = _collectors.get(key)
+            if registered is None or time.time() - registered.created_time > self.reconnect_after:
+                if shared is not None:
+                    self.log.info("Reconnecting to DMS Spy after %d seconds." % self.reconnect_after)
+                registered = SharedCollector(
+                    DmsCollector(self.admin_url, username=self.username, password=self.password)
+                )
+                with _collectors_lock:
+                    _collectors[key] = registered
+                self.log.info(
+                    "DMS provider initialized: url=%s, username=%s, password=(secret)" % (self.admin_url, self.username)
+                )
+            shared = self.local.shared = registered
+        return shared
 
     def table(self, table, include=[], exclude=[], filter=None):
-        self.init_dms()
-        d = self.dms.collect(table, include=include, exclude=exclude, filter=filter)
+        d = self.init_dms().dms.collect(table, include=include, exclude=exclude, filter=filter)
 
         def _add_time(x):
             x["time"] = d["time"]
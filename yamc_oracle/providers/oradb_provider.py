@@ -2,90 +2,205 @@
 # @author: Tomas Vitvar, https://vitvar.com, tomas@vitvar.com
 
 import re
+import contextlib
 import time
 import os
+import threading
+import itertools
+import logging
+
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
 
 import oracledb
 
 from yamc.providers import PerformanceProvider
 from yamc.utils import Map
 
+PASSWORD_PATTERN = re.compile(r"/(.+)@")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
 
-def makeDictFactory(cursor):
-    columnNames = [d[0].lower() for d in cursor.description]
+def makeDictFactory(cursor, **extra):
+    columnNames = [d[0].lower() for d in cursor.description] + list(extra.keys())
+    extraValues = tuple(extra.values())
 
     def createRow(*args):
-        return dict(zip(columnNames, args))
+        return dict(zip(columnNames, args + extraValues))
 
     return createRow
 
 
 def hide_password(connstr):
-    return re.sub("\/(.+)@", "/(secret)@", connstr)
+    return PASSWORD_PATTERN.sub("/(secret)@", connstr)
 
 
 class OraDBProvider(PerformanceProvider):
     def __init__(self, config, component_id):
         super().__init__(config, component_id)
 
-        self.connection = None
-        self.connect_time = None
+        self.pool = None
+        self.lock = threading.Lock()
+        self.perf_lock = threading.Lock()
         self.cache = Map()
 
         # configuration
         self.connstr = self.config.value_str("connstr", required=True)
         self.reconnect_after = self.config.value_int("reconnect_after", required=False, default=3600)
+        self.min_connections = self.config.value_int("min_connections", required=False, default=1)
+        self.max_connections = self.config.value_int("max_connections", required=False, default=4)
+        self.wait_timeout = self.config.value_int("wait_timeout", required=False, default=60)
+        self.fetch_arraysize = self.config.value_int("fetch_arraysize", required=False, default=1000)
         self.sql_files_dir = self.config.get_dir_path(self.config.value_str("sql_files_dir", required=True), check=True)
 
+        # runs the statements of sql_many and sql_parallel, one per pooled connection
+        self.executor = ThreadPoolExecutor(max_workers=self.max_connections)
+
     def open(self):
-        if self.connection is None or time.time() - self.connect_time > self.reconnect_after:
-            if self.connection is not None:
-                self.close()
-            self.log.info(f"Opening the DB connection, connstr={hide_password(self.connstr)}")
-            self.connection = oracledb.connect(self.connstr)
-            self.connect_time = time.time()
+        with self.lock:
+            if self.pool is None:
+                self.log.info(
+                    f"Creating the DB connection pool, connstr={hide_password(self.connstr)}, "
+                    + f"min_connections={self.min_connections}, max_connections={self.max_connections}"
+                )
+                self.pool = oracledb.create_pool(
+                    dsn=self.connstr,
+                    min=self.min_connections,
+                    max=self.max_connections,
+                    increment=1,
+                    getmode=oracledb.POOL_GETMODE_TIMEDWAIT,
+                    wait_timeout=self.wait_timeout * 1000,
+                    max_lifetime_session=self.reconnect_after,
+                )
+            return self.pool
 
     def close(self):
-        if self.connection is not None:
-            self.log.info("Closing the DB connection.")
-            self.connection.close()
-            self.connection = None
+        with self.lock:
+            if self.pool is not None:
+                self.log.info("Closing the DB connection pool.")
+                self.pool.close(force=True)
+                self.pool = None
 
     def destroy(self):
         super().destroy()
         self.close()
+        self.executor.shutdown(wait=False)
 
     def load_statement(self, sql_file):
         if self.cache.get(sql_file) is None:
             fname = "%s/%s" % (self.sql_files_dir, sql_file)
             if not os.path.isfile(fname):
                 raise Exception("The SQL file %s does not exist!" % fname)
-            lines = []
             with open(fname, "r") as file:
-                lines = [x for x in file]
-            self.cache[sql_file] = "".join(lines)
+                self.cache[sql_file] = file.read()
         return self.cache[sql_file]
 
-    def sql(self, sql_file, variables=[]):
+    def prepare(self, sql_file):
         statement = self.load_statement(sql_file)
-        self.open()
-        self.log.debug("Running the SQL statement: %s" % re.sub("\s+", " ", statement))
-        cursor = self.connection.cursor()
-        try:
+        pool = self.open()
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug("Running the SQL statement: %s", WHITESPACE_PATTERN.sub(" ", statement))
+        return statement, pool
+
+    def execute(self, pool, statement, variables, query_time=None):
+        """
+        Executes `statement` on a connection acquired from `pool` and yields the result rows in batches of
+        `fetch_arraysize` rows. The rows are stamped with `query_time`, or with the time of the execution when
+        it is not given. The connection is held until the generator is exhausted or closed.
+        """
+        with pool.acquire() as connection:
+            cursor = connection.cursor()
+            cursor.arraysize = self.fetch_arraysize
+            cursor.prefetchrows = self.fetch_arraysize + 1
+            try:
+                if query_time is None:
+                    query_time = time.time()
+                cursor.execute(statement, variables)
+                cursor.rowfactory = makeDictFactory(cursor, time=query_time)
+                while True:
+                    rows = cursor.fetchmany()
+                    if not rows:
+                        break
+                    yield rows
+            finally:
+                cursor.close()
+
+    def record_perf(self, sql_file, num_rows, running_time):
+        with self.perf_lock:
+            self.update_perf(os.path.basename(sql_file), num_rows, running_time)
+        self.log.info(
+            f"The result of the statement {os.path.basename(sql_file)} has {num_rows} rows and was retrieved "
+            + f"in {running_time:0.04f} seconds."
+        )
+
+    def fetch(self, sql_file, variables=[]):
+        """
+        Runs the statement from `sql_file` and returns a generator of the result rows in batches of
+        `fetch_arraysize` rows. The SQL file is loaded and the pool opened before this method returns, the
+        pooled connection is held until the generator is exhausted or closed.
+        """
+        statement, pool = self.prepare(sql_file)
+
+        def _batches():
             query_time = time.time()
-            cursor.execute(statement, variables)
-            cursor.rowfactory = makeDictFactory(cursor)
+            num_rows = 0
+            with contextlib.closing(self.execute(pool, statement, variables)) as batches:
+                for rows in batches:
+                    num_rows += len(rows)
+                    yield rows
+            self.record_perf(sql_file, num_rows, time.time() - query_time)
+
+        return _batches()
+
+    def sql(self, sql_file, variables=[], stream=False):
+        """
+        Runs the statement from `sql_file` and returns the result rows as a list. When `stream` is true,
+        returns a generator over the rows instead so that large results are not held in memory at once;
+        closing it releases the pooled connection.
+        """
+        batches = self.fetch(sql_file, variables)
+        if stream:
+
+            def _rows():
+                with contextlib.closing(batches):
+                    for rows in batches:
+                        yield from rows
+
+            return _rows()
+        data = []
+        for rows in batches:
+            data.extend(rows)
+        return data
+
+    def sql_many(self, statements):
+        """
+        Runs several statements concurrently, each on its own pooled connection. `statements` is a list of
+        `(sql_file, variables)` tuples, the result is the list of their rows in the same order.
+        """
+        return list(self.executor.map(lambda x: self.sql(*x), statements))
+
+    def sql_parallel(self, sql_file, partitions, variables={}):
+        """
+        Runs the statement from `sql_file` as `partitions` concurrent queries and returns their combined rows.
+        The statement must select its share of the result using the `:partitions` and `:partition` bind
+        variables, for example `where mod(ora_hash(rowid), :partitions) = :partition`. Other `variables` must
+        therefore be named binds given as a mapping. All rows are stamped with the same time.
+        """
+        if partitions < 1:
+            raise ValueError("The number of partitions must be at least 1, got %s!" % partitions)
+        if not isinstance(variables, Mapping):
+            raise TypeError("The variables of sql_parallel must be a mapping of named binds!")
+        statement, pool = self.prepare(sql_file)
+
+        def _partition(i):
             data = []
-            for row in cursor:
-                row["time"] = query_time
-                data.append(row)
-            running_time = time.time() - query_time
-
-            self.update_perf(os.path.basename(sql_file), len(data), running_time)
-            self.log.info(
-                f"The result of the statement {os.path.basename(sql_file)} has {len(data)} rows and was retrieved "
-                + f"in {time.time()-query_time:0.04f} seconds."
-            )
+            binds = dict(variables, partitions=partitions, partition=i)
+            with contextlib.closing(self.execute(pool, statement, binds, query_time=query_time)) as batches:
+                for rows in batches:
+                    data.extend(rows)
             return data
-        finally:
-            cursor.close()
+
+        query_time = time.time()
+        data = list(itertools.chain.from_iterable(self.executor.map(_partition, range(partitions))))
+        self.record_perf(sql_file, len(data), time.time() - query_time)
+        return data